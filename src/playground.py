@@ -1,25 +1,28 @@
 import dotenv
 import os
-import subprocess
+import json
 import httpx
 import asyncio
+import aiofiles
 import logging
 
 from dataclasses import dataclass
 from datetime import datetime
-from pydantic import BaseModel, Field
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, Field
 from pydantic_ai import Agent, RunContext
 from pydantic_ai.models.openai import OpenAIModel
 from pydantic_ai.providers.openai import OpenAIProvider
 from openai import AsyncOpenAI
 from typing import List, Optional
 from pathlib import Path
-from rich.console import Console
 
 from run_logging.local import save_message_history, save_full_message_history
 from run_logging.wandb import setup_logging
 from utils.models import MODELS
 from utils.create_user import create_new_user_and_rundir
+from utils.llm_cache import PipelineCache
+from utils.batching import DynamicBatcher
 
 
 dotenv.load_dotenv()
@@ -35,13 +38,33 @@ CODE_OUTPUT_PATH = Path("../generated/")
 agent_id = create_new_user_and_rundir(workspace_dir = Path(CODE_OUTPUT_PATH))
 CODE_OUTPUT_PATH = CODE_OUTPUT_PATH / agent_id
 
-config = {
-    # "model" : MODELS.GPT4o_mini,
-    "model" : MODELS.GPT4_1,
-    "temperature" : 1,
-    "max_run_retries" : 1,
-    "max_validation_retries" : 5,
-    "prompt" : f"""Create a bioinformatics pipeline in snakemake for the following:
+class Settings(BaseModel):
+    """Immutable run configuration, validated once at import."""
+    model_config = ConfigDict(frozen=True)
+
+    model: MODELS
+    temperature: float
+    max_run_retries: int
+    max_validation_retries: int
+    prompt: str
+    use_proxy: bool
+    max_concurrent_llm_calls: int # cap on outbound agent calls across all pipelines
+    use_llm_cache: bool # reuse prior outputs for repeated/paraphrased requests
+    stream: bool # stream code generation to overlap file I/O with the LLM
+    batch_timeout_ms: int # batching window for concurrent pipeline requests
+    max_batch_size: int
+    cache_similarity_threshold: float
+    workspace_dir: Path
+    tags: str
+    agent_id: str
+
+settings = Settings(
+    # model=MODELS.GPT4o_mini,
+    model=MODELS.GPT4_1,
+    temperature=1,
+    max_run_retries=1,
+    max_validation_retries=5,
+    prompt=f"""Create a bioinformatics pipeline in snakemake for the following:
         * Quality Control Assessment - Run FastQC analysis and generate MultiQC reports to evaluate the quality of raw sequencing data
         * Data Preprocessing - Perform essential preprocessing steps including:
         * Adapter trimming to remove sequencing artifacts
@@ -58,58 +81,112 @@ config = {
 
         At the end, create a bash file containing a command to run a dry run for the created code.
         """,
-    # "prompt" : "toolcalling_agent.yaml", # TODO write prompt to a separate file
-    "use_proxy" : False,
-    "workspace_dir" : Path(CODE_OUTPUT_PATH),
-    "tags" : "",
-    "agent_id": agent_id,
-}
-
-async_http_client = httpx.AsyncClient(
-    timeout= 1 * 60
+    # prompt="toolcalling_agent.yaml", # TODO write prompt to a separate file
+    use_proxy=False,
+    max_concurrent_llm_calls=4,
+    use_llm_cache=True,
+    stream=True,
+    batch_timeout_ms=50,
+    max_batch_size=16,
+    cache_similarity_threshold=0.95,
+    workspace_dir=Path(CODE_OUTPUT_PATH),
+    tags="",
+    agent_id=agent_id,
 )
 
+# Shared across all concurrently generated pipelines so we stay under the
+# OpenAI concurrency limit no matter how large the batch is.
+llm_semaphore = asyncio.Semaphore(settings.max_concurrent_llm_calls)
+
+# Lives next to the per-run output dirs so cache hits survive across runs.
+pipeline_cache = PipelineCache(
+    CODE_OUTPUT_PATH.parent / "llm_cache",
+    similarity_threshold=settings.cache_similarity_threshold,
+)
+
+def build_async_http_client(timeout: float = 1 * 60):
+    """Build the shared HTTP client for all OpenAI calls.
+
+    Prefer requestx (Rust-backed, scales better under concurrent agent calls)
+    when it is installed, but AsyncOpenAI only accepts httpx-compatible
+    clients, so fall back to httpx otherwise.
+    """
+    try:
+        import requestx
+        client = requestx.AsyncClient(timeout=timeout)
+        if isinstance(client, httpx.AsyncClient): # AsyncOpenAI rejects anything else
+            return client
+    except ImportError:
+        pass
+    # HTTP/2 multiplexes concurrent LLM calls over one TLS connection,
+    # avoiding a handshake per parallel request.
+    return httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=64,
+            max_keepalive_connections=32,
+            keepalive_expiry=60,
+        ),
+        timeout=httpx.Timeout(timeout, connect=10),
+    )
+
+async_http_client = build_async_http_client()
+
 # Initialize OpenAI client
 client = AsyncOpenAI(
-    api_key=os.getenv('OPENAI_API_KEY'),
+    api_key=api_key,
     http_client=async_http_client,
 )
 
 model = OpenAIModel(
-    config['model'],
+    settings.model,
     provider=OpenAIProvider(openai_client=client),
 )
 
-# setup_logging(config, api_key=wandb_key)
+# setup_logging(settings, api_key=wandb_key)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class BioinformaticsContext:
     project_type: str
     data_types: List[str]
     analysis_goals: List[str]
 
 class WorkflowDesign(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=False)
+
     analysis_steps: List[str] = Field(description="Ordered analysis steps")
     tools_required: List[str] = Field(description="Required bioinformatics tools")
     data_flow: str = Field(description="Data flow description")
 
 class SnakemakeCode(BaseModel):
+    model_config = ConfigDict(frozen=True, defer_build=False)
+
     snakefile: str = Field(description="Complete Snakemake pipeline")
     config_yaml: str = Field(description="Configuration file")
     environment_yaml: str = Field(description="Conda environment")
     documentation: str = Field(description="Pipeline documentation")
 
+# Force JSON-schema construction at import so the first agent call does not
+# pay for it.
+WorkflowDesign.model_json_schema()
+SnakemakeCode.model_json_schema()
+
 
 # Architecture design agent
 workflow_agent = Agent(
     model=model,
     output_type=WorkflowDesign, # TODO do we need this?
     deps_type=BioinformaticsContext, # TODO do we need this?
+    # Static prompt first; the dynamic @system_prompt hook appends after it,
+    # so the prefix stays byte-identical across calls and OpenAI can cache it.
     system_prompt="""You are a bioinformatics workflow architect.
     Design comprehensive analysis pipelines considering:
     - Data types and analysis goals
     - Tool selection and integration""",
-    model_settings={'temperature':config['temperature']},
+    model_settings={
+        'temperature':settings.temperature,
+        'extra_body': {'prompt_cache_key': 'workflow_v1'},
+    },
 )
 
 # Code generation agent
@@ -123,7 +200,10 @@ code_agent = Agent(
     - Proper rule definitions and dependencies
     - Error handling
     - Conda environment specifications file""",
-    model_settings={'temperature':config['temperature']},
+    model_settings={
+        'temperature':settings.temperature,
+        'extra_body': {'prompt_cache_key': 'code_v1'},
+    },
 )
 
 @code_agent.tool
@@ -133,10 +213,10 @@ async def save_code_to_file(
     filename: str,
     # code_folder: str = CODE_OUTPUT_PATH #TODO how to force agent to write code to a specific folder?
 ) -> str:
-    f"""Save Python code to a file and return confirmation."""
+    """Save Python code to a file and return confirmation."""
     try:
-        file_path = Path(filename)
-        file_path.write_text(code)
+        async with aiofiles.open(Path(filename), 'w') as f:
+            await f.write(code)
         print(f"Code saved successfully to {filename}")
         return f"Code saved successfully to {filename}"
     except Exception as e:
@@ -149,37 +229,56 @@ async def run_python_script(
 ) -> str:
     """Run a Python script and return terminal output."""
     try:
-        result = subprocess.run(
-            ['python', script_path],
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
+        # Async subprocess so a long-running script does not block the event
+        # loop (and with it every concurrent agent call).
+        proc = await asyncio.create_subprocess_exec(
+            'python', script_path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
         )
-        
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=300)  # 5 minute timeout
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            return "Script execution timed out after 5 minutes"
+
         output = ""
-        if result.stdout:
-            output += f"STDOUT:\n{result.stdout}\n"
-        if result.stderr:
-            output += f"STDERR:\n{result.stderr}\n"
-        output += f"Return code: {result.returncode}"
-        
+        if stdout:
+            output += f"STDOUT:\n{stdout.decode()}\n"
+        if stderr:
+            output += f"STDERR:\n{stderr.decode()}\n"
+        output += f"Return code: {proc.returncode}"
+
         return output
-    except subprocess.TimeoutExpired:
-        return "Script execution timed out after 5 minutes"
     except Exception as e:
         return f"Error running script: {str(e)}"
 
+# The rendered context is constant for a given deps, so memoize it instead of
+# re-joining/formatting on every agent call. Keyed on tuples because the
+# dataclass fields are lists (unhashable); the string is also a stable prompt
+# prefix for caching purposes.
+@lru_cache(maxsize=None)
+def _render_workflow_context(project_type: str, data_types: tuple, analysis_goals: tuple) -> str:
+    return f"""Project: {project_type}
+    Data types: {', '.join(data_types)}
+    Goals: {', '.join(analysis_goals)}"""
+
+@lru_cache(maxsize=None)
+def _render_code_context(project_type: str, data_types: tuple) -> str:
+    return f"""Generate Snakemake pipeline for {project_type}
+    Handle data types: {', '.join(data_types)}"""
+
 # Pipeline coordinator
 @workflow_agent.system_prompt
 def add_context(ctx: RunContext[BioinformaticsContext]) -> str:
-    return f"""Project: {ctx.deps.project_type}
-    Data types: {', '.join(ctx.deps.data_types)}
-    Goals: {', '.join(ctx.deps.analysis_goals)}"""
+    return _render_workflow_context(
+        ctx.deps.project_type, tuple(ctx.deps.data_types), tuple(ctx.deps.analysis_goals)
+    )
 
 @code_agent.system_prompt
 def add_implementation_context(ctx: RunContext[BioinformaticsContext]) -> str:
-    return f"""Generate Snakemake pipeline for {ctx.deps.project_type}
-    Handle data types: {', '.join(ctx.deps.data_types)}"""
+    return _render_code_context(ctx.deps.project_type, tuple(ctx.deps.data_types))
 
 async def generate_bioinformatics_pipeline(
     user_request: str,
@@ -188,53 +287,112 @@ async def generate_bioinformatics_pipeline(
 ) -> tuple[WorkflowDesign, SnakemakeCode]:
     """Generate complete bioinformatics pipeline."""
 
+    if settings.use_llm_cache:
+        cached = pipeline_cache.get(
+            user_request, context.project_type, context.data_types, context.analysis_goals
+        )
+        if cached is not None:
+            logging.info("LLM cache hit, skipping agent calls")
+            return (
+                WorkflowDesign.model_validate(cached['design']),
+                SnakemakeCode.model_validate(cached['code']),
+            )
+
     # Step 1: Design workflow architecture
-    workflow_result = await workflow_agent.run(user_request, deps=context)
+    async with llm_semaphore:
+        workflow_result = await workflow_agent.run(user_request, deps=context)
     design = workflow_result.output
     workflow_history = workflow_result.all_messages()
-    
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     history_file = output_dir / f"workflow_design_history_{timestamp}.json"
-    
-    await save_message_history(workflow_history, history_file)
-    logging.info(f"Workflow design history saved to {history_file}")
-    
+
+    # Persist the design history in the background so file I/O does not delay
+    # the second LLM call.
+    save_workflow_history_task = asyncio.create_task(
+        save_message_history(workflow_history, history_file)
+    )
+
     # Step 2: Generate Snakemake implementation
     code_prompt = f"""Generate Snakemake pipeline implementing this design:
-    
+
     Steps: {design.analysis_steps}
     Tools: {design.tools_required}
     Data flow: {design.data_flow}
-    
+
     Original request: {user_request}"""
-    
-    code_result = await code_agent.run(code_prompt, deps=context)
-    snakemake_history = code_result.all_messages()
+
+    if settings.stream:
+        # Stream the structured output so partial results hit disk while the
+        # model is still generating, instead of waiting for the last token.
+        stream_file = output_dir / f"snakemake_generation_stream_{timestamp}.ndjson"
+        async with llm_semaphore:
+            async with code_agent.run_stream(code_prompt, deps=context) as stream:
+                async with aiofiles.open(stream_file, 'w', encoding='utf-8') as f:
+                    async for message, last in stream.stream_structured(debounce_by=1.0):
+                        await f.write(json.dumps({"last": last, "message": message}, default=str) + "\n")
+                code_output = await stream.get_output()
+                snakemake_history = stream.all_messages()
+    else:
+        # Non-streaming fallback, e.g. when output validation needs the full
+        # document at once.
+        async with llm_semaphore:
+            code_result = await code_agent.run(code_prompt, deps=context)
+        code_output = code_result.output
+        snakemake_history = code_result.all_messages()
+
+    await save_workflow_history_task
+    logging.info(f"Workflow design history saved to {history_file}")
 
     snakemake_history_file = output_dir / f"snakemake_generation_history_{timestamp}.json"
     await save_message_history(snakemake_history, snakemake_history_file)
 
     full_history_file = output_dir / f"full_pipeline_history_{timestamp}.json"
     await save_full_message_history(workflow_history, snakemake_history, design, user_request, context, full_history_file)
-    
-    return design, code_result.output
-
-async def main():
-    context = BioinformaticsContext(
-        project_type="Quality control and trimming for RNA-seq",
-        data_types=["fastq"],
-        # data_types=["fastq", "gtf", "fasta"],
-        analysis_goals=["quality_control", "trimming"]
-    )
-    
-    design, code = await generate_bioinformatics_pipeline(
-        config['prompt'],
-        context,
-        output_dir=CODE_OUTPUT_PATH,
-    )
-    
-    print(f"Workflow design: {design.analysis_steps}")
-    print(f"Generated Snakemake code:\n{code.snakefile}")
+
+    if settings.use_llm_cache:
+        pipeline_cache.put(
+            user_request, context.project_type, context.data_types, context.analysis_goals,
+            design.model_dump(), code_output.model_dump(),
+        )
+
+    return design, code_output
+
+# Coalesces concurrent pipeline requests: duplicates submitted within one
+# batching window share a single generation run, the rest fan out together
+# under llm_semaphore.
+pipeline_batcher = DynamicBatcher(
+    generate_bioinformatics_pipeline,
+    key=lambda user_request, context, output_dir=None: (
+        user_request,
+        context.project_type,
+        tuple(context.data_types),
+        tuple(context.analysis_goals),
+    ),
+    timeout_ms=settings.batch_timeout_ms,
+    max_batch_size=settings.max_batch_size,
+)
+
+async def main(requests: Optional[List[tuple[str, BioinformaticsContext]]] = None):
+    if requests is None:
+        context = BioinformaticsContext(
+            project_type="Quality control and trimming for RNA-seq",
+            data_types=["fastq"],
+            # data_types=["fastq", "gtf", "fasta"],
+            analysis_goals=["quality_control", "trimming"]
+        )
+        requests = [(settings.prompt, context)]
+
+    # All pipelines run concurrently; the batcher dedupes identical requests
+    # and llm_semaphore caps the outbound calls.
+    results = await asyncio.gather(*[
+        pipeline_batcher.submit(prompt, context, output_dir=CODE_OUTPUT_PATH)
+        for prompt, context in requests
+    ])
+
+    for design, code in results:
+        print(f"Workflow design: {design.analysis_steps}")
+        print(f"Generated Snakemake code:\n{code.snakefile}")
 
 asyncio.run(main())
 
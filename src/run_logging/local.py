@@ -1,7 +1,70 @@
-import json
+import aiofiles
+import orjson
 from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Callable, List
+
+# Compact output for machine-read files; human-facing files add the indent.
+_ORJSON_OPTS_COMPACT = (
+    orjson.OPT_SERIALIZE_NUMPY
+    | orjson.OPT_NON_STR_KEYS
+    | orjson.OPT_NAIVE_UTC
+)
+_ORJSON_OPTS = _ORJSON_OPTS_COMPACT | orjson.OPT_INDENT_2
+
+
+def _extract_pydantic(msg, index: int, now_iso: str) -> dict:
+    """Extract data from a pydantic model via a single model_dump()."""
+    msg_data = msg.model_dump(mode='json')
+    return {
+        "id": index,
+        "timestamp": msg_data.get("timestamp", now_iso),
+        "role": msg_data.get("role", "unknown"),
+        "content": str(msg_data.get("content", "")),
+        "metadata": msg_data.get("metadata", {}),
+        "raw_data": msg_data
+    }
+
+def _extract_dict(msg, index: int, now_iso: str) -> dict:
+    return {
+        "id": index,
+        "timestamp": msg.get("timestamp", now_iso),
+        "role": msg.get("role", "unknown"),
+        "content": str(msg.get("content", "")),
+        "metadata": msg.get("metadata", {})
+    }
+
+# Histories repeat the same 2-3 message classes, so memoize the name lookup.
+_TYPE_NAMES: dict[type, str] = {}
+
+def _extract_object(msg, index: int, now_iso: str) -> dict:
+    """Generic extractor; the getattr defaults also cover plain values."""
+    cls = type(msg)
+    return {
+        "id": index,
+        "timestamp": getattr(msg, 'timestamp', now_iso),
+        "role": getattr(msg, 'role', 'unknown'),
+        "content": str(getattr(msg, 'content', str(msg))),
+        "metadata": getattr(msg, 'metadata', {}),
+        "type": _TYPE_NAMES.setdefault(cls, cls.__name__)
+    }
+
+# Message histories contain only a handful of distinct classes, so resolve the
+# right extractor once per class instead of re-running hasattr/isinstance
+# checks on every message.
+_EXTRACTORS: dict[type, Callable] = {}
+
+def _resolve(cls: type) -> Callable:
+    extractor = _EXTRACTORS.get(cls)
+    if extractor is None:
+        if hasattr(cls, 'model_dump'):
+            extractor = _extract_pydantic
+        elif issubclass(cls, dict):
+            extractor = _extract_dict
+        else:
+            extractor = _extract_object
+        _EXTRACTORS[cls] = extractor
+    return extractor
 
 
 async def save_message_history(
@@ -10,86 +73,56 @@ async def save_message_history(
     format_type: str = "json"
 ) -> None:
     """Save message history to file with proper formatting."""
-    
-    def extract_message_data(msg, index: int) -> dict:
-        """Extract data from Pydantic AI message objects."""
-        if hasattr(msg, 'model_dump'):
-            # Pydantic model - use model_dump()
-            msg_data = msg.model_dump()
-            return {
-                "id": index,
-                "timestamp": msg_data.get("timestamp", datetime.now().isoformat()),
-                "role": msg_data.get("role", "unknown"),
-                "content": str(msg_data.get("content", "")),
-                "metadata": msg_data.get("metadata", {}),
-                "raw_data": msg_data
-            }
-        elif hasattr(msg, '__dict__'):
-            # Object with attributes
-            return {
-                "id": index,
-                "timestamp": getattr(msg, 'timestamp', datetime.now().isoformat()),
-                "role": getattr(msg, 'role', 'unknown'),
-                "content": str(getattr(msg, 'content', str(msg))),
-                "metadata": getattr(msg, 'metadata', {}),
-                "type": type(msg).__name__
-            }
-        elif isinstance(msg, dict):
-            # Dictionary
-            return {
-                "id": index,
-                "timestamp": msg.get("timestamp", datetime.now().isoformat()),
-                "role": msg.get("role", "unknown"),
-                "content": str(msg.get("content", "")),
-                "metadata": msg.get("metadata", {})
-            }
-        else:
-            # Fallback for other types
-            return {
-                "id": index,
-                "timestamp": datetime.now().isoformat(),
-                "role": "unknown",
-                "content": str(msg),
-                "metadata": {},
-                "type": type(msg).__name__
-            }
-    
+
+    # One clock read per save; reused as the default timestamp everywhere.
+    now = datetime.now()
+    now_iso = now.isoformat()
+
     if format_type.lower() == "json":
         try:
-            messages_data = [extract_message_data(msg, i) for i, msg in enumerate(message_history)]
+            messages_data = [_resolve(type(msg))(msg, i, now_iso) for i, msg in enumerate(message_history)]
             
             history_data = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now_iso,
                 "total_messages": len(message_history),
                 "messages": messages_data
             }
             
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, indent=2, ensure_ascii=False, default=str)
-                
+            # orjson writes bytes, so open the file in binary mode; aiofiles
+            # keeps the event loop free while the history hits disk.
+            async with aiofiles.open(file_path, 'wb') as f:
+                await f.write(orjson.dumps(history_data, default=str, option=_ORJSON_OPTS))
+
         except Exception as e:
             # Fallback: save as string representation
             fallback_data = {
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now_iso,
                 "total_messages": len(message_history),
                 "error": f"Failed to serialize messages: {str(e)}",
                 "messages_str": [str(msg) for msg in message_history]
             }
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(fallback_data, f, indent=2, ensure_ascii=False)
+            async with aiofiles.open(file_path, 'wb') as f:
+                await f.write(orjson.dumps(fallback_data, option=_ORJSON_OPTS))
     
     elif format_type.lower() == "markdown":
-        with open(file_path.with_suffix('.md'), 'w', encoding='utf-8') as f:
-            f.write(f"# Workflow Design History\n\n")
-            f.write(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n")
-            
-            for i, msg in enumerate(message_history):
-                msg_data = extract_message_data(msg, i)
-                f.write(f"## Message {i+1}\n\n")
-                f.write(f"**Role:** {msg_data['role']}\n\n")
-                f.write(f"**Type:** {msg_data.get('type', 'Unknown')}\n\n")
-                f.write(f"**Content:**\n{msg_data['content']}\n\n")
-                f.write("---\n\n")
+        # Build the document in memory and flush it in one write instead of
+        # five writes per message.
+        parts = [
+            f"# Workflow Design History\n\n",
+            f"Generated: {now.strftime('%Y-%m-%d %H:%M:%S')}\n\n",
+        ]
+        for i, msg in enumerate(message_history):
+            msg_data = _resolve(type(msg))(msg, i, now_iso)
+            parts.append(
+                f"## Message {i+1}\n\n"
+                f"**Role:** {msg_data['role']}\n\n"
+                f"**Type:** {msg_data.get('type', 'Unknown')}\n\n"
+                f"**Content:**\n{msg_data['content']}\n\n"
+                "---\n\n"
+            )
+
+        async with aiofiles.open(file_path.with_suffix('.md'), 'w', encoding='utf-8') as f:
+            await f.write(''.join(parts))
 
 
 async def save_full_message_history(
@@ -100,12 +133,16 @@ async def save_full_message_history(
     context: 'BioinformaticsContext',
     file_path: Path
 ) -> None:
-    """Save all agent messages without formatting."""
-    
+    """Save all agent messages without formatting.
+
+    Written compact (no indent) since this file is only reloaded/replayed by
+    machines; pipe it through `python -m json.tool` to inspect by hand.
+    """
+
     all_messages = {
         "workflow_messages": workflow_history,
         "snakemake_messages": snakemake_history
     }
-    
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(all_messages, f, indent=2, default=str)
\ No newline at end of file
+
+    async with aiofiles.open(file_path, 'wb') as f:
+        await f.write(orjson.dumps(all_messages, default=str, option=_ORJSON_OPTS_COMPACT))
\ No newline at end of file
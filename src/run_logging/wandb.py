@@ -1,13 +1,14 @@
-import wandb
-from dataclasses import asdict
+def setup_logging(settings, api_key, dir="/tmp/wandb"):
+    # Imported lazily: wandb costs hundreds of ms at import and logging may
+    # be disabled entirely.
+    import wandb
 
-def setup_logging(config, api_key, dir="/tmp/wandb"):
     wandb.login(key=api_key)
     wandb.init(
-        dir=config["workspace_dir"] / dir,
+        dir=settings.workspace_dir / dir,
         entity="bioit-ai",
         project="agentic-pipelines",
-        tags=config["tags"],
-        config=config,
-        name=config["agent_id"],
+        tags=settings.tags,
+        config=settings.model_dump(),
+        name=settings.agent_id,
     )
\ No newline at end of file
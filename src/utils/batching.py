@@ -0,0 +1,73 @@
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class DynamicBatcher:
+    """Coalesce concurrent requests into batches before dispatching.
+
+    Submissions are collected until timeout_ms elapses or max_batch_size
+    entries are queued, deduplicated by key so identical requests share a
+    single underlying call, and then dispatched concurrently. This amortizes
+    per-request overhead (connection setup, prompt prefix) when many pipeline
+    requests arrive at once.
+    """
+
+    def __init__(
+        self,
+        worker: Callable[..., Awaitable],
+        key: Callable[..., Hashable],
+        timeout_ms: float = 50,
+        max_batch_size: int = 16,
+    ):
+        self._worker = worker
+        self._key = key
+        self._timeout = timeout_ms / 1000
+        self._max_batch_size = max_batch_size
+        self._pending = {}  # key -> (args, kwargs, future)
+        self._flush_task = None
+        self._lock = asyncio.Lock()
+
+    async def submit(self, *args, **kwargs):
+        """Queue a request and wait for its result.
+
+        Requests with the same key submitted within one batching window share
+        one worker call and all receive its result.
+        """
+        request_key = self._key(*args, **kwargs)
+        async with self._lock:
+            entry = self._pending.get(request_key)
+            if entry is None:
+                future = asyncio.get_running_loop().create_future()
+                self._pending[request_key] = (args, kwargs, future)
+                if len(self._pending) >= self._max_batch_size:
+                    self._flush_locked()
+                elif self._flush_task is None:
+                    self._flush_task = asyncio.create_task(self._flush_after_timeout())
+            else:
+                future = entry[2]
+        return await future
+
+    async def _flush_after_timeout(self):
+        await asyncio.sleep(self._timeout)
+        async with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        """Dispatch everything queued; caller must hold the lock."""
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+        self._flush_task = None
+        batch = list(self._pending.values())
+        self._pending.clear()
+        for args, kwargs, future in batch:
+            asyncio.create_task(self._run_one(args, kwargs, future))
+
+    async def _run_one(self, args, kwargs, future):
+        try:
+            result = await self._worker(*args, **kwargs)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
@@ -1,9 +1,13 @@
-import subprocess
 import sys
 from hrid import HRID
 
+# Single-pass replacement of '-' and ' ' instead of chained str.replace calls.
+_TRANS = str.maketrans({'-': '_', ' ': '_'})
+
 def create_new_user_and_rundir(workspace_dir):
-    run_id = "_".join(HRID().generate().replace("-", "_").replace(" ","_").split("_")[:-1])[:32]
+    raw = HRID().generate().translate(_TRANS)
+    # Drop the trailing token (was split/join) and truncate, without copies.
+    run_id = raw[:raw.rfind("_")][:32] if "_" in raw else raw[:32]
     run_dir = workspace_dir / run_id
 
     run_dir.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,96 @@
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics.pairwise import cosine_similarity
+
+
+def _prompt_document(user_request: str, project_type: str, data_types: List[str], analysis_goals: List[str]) -> str:
+    """Flatten a request + context into a single text document for matching."""
+    return "\n".join([
+        user_request,
+        project_type,
+        ", ".join(data_types),
+        ", ".join(analysis_goals),
+    ])
+
+
+class PipelineCache:
+    """Disk-backed cache for generated (WorkflowDesign, SnakemakeCode) pairs.
+
+    Two layers:
+    - exact match on the sha256 of the prompt tuple (fast path),
+    - semantic match via TF-IDF cosine similarity over previous prompts, so
+      paraphrased requests against the same context also hit.
+
+    Entries are stored as plain JSON (model_dump output) so the cache does not
+    depend on the agent modules; callers re-validate with their own models.
+    """
+
+    def __init__(self, cache_dir: Path, similarity_threshold: float = 0.95):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.similarity_threshold = similarity_threshold
+        self._exact = {}  # sha256 key -> entry dict
+        self._documents = []  # prompt document per entry, aligned with _entries
+        self._entries = []
+        self._vectorizer = TfidfVectorizer()
+        self._matrix = None  # rebuilt lazily after every put
+        self._load_existing()
+
+    def _load_existing(self) -> None:
+        for entry_file in sorted(self.cache_dir.glob("*.json")):
+            try:
+                entry = json.loads(entry_file.read_text(encoding="utf-8"))
+                self._exact[entry["key"]] = entry
+                self._documents.append(entry["document"])
+                self._entries.append(entry)
+            except (json.JSONDecodeError, KeyError) as e:
+                logging.warning(f"Skipping unreadable cache entry {entry_file}: {e}")
+
+    @staticmethod
+    def _key(document: str) -> str:
+        return hashlib.sha256(document.encode("utf-8")).hexdigest()
+
+    def get(self, user_request: str, project_type: str, data_types: List[str], analysis_goals: List[str]) -> Optional[dict]:
+        """Return a cached entry for this request, or None on a miss."""
+        document = _prompt_document(user_request, project_type, data_types, analysis_goals)
+
+        exact = self._exact.get(self._key(document))
+        if exact is not None:
+            return exact
+
+        if not self._documents:
+            return None
+
+        if self._matrix is None:
+            self._matrix = self._vectorizer.fit_transform(self._documents)
+        query = self._vectorizer.transform([document])
+        similarities = cosine_similarity(query, self._matrix)[0]
+        best = similarities.argmax()
+        if similarities[best] >= self.similarity_threshold:
+            logging.info(f"Semantic cache hit (similarity {similarities[best]:.3f})")
+            return self._entries[best]
+        return None
+
+    def put(self, user_request: str, project_type: str, data_types: List[str], analysis_goals: List[str],
+            design: dict, code: dict) -> None:
+        """Store the generated outputs (as model_dump dicts) for this request."""
+        document = _prompt_document(user_request, project_type, data_types, analysis_goals)
+        key = self._key(document)
+        entry = {
+            "key": key,
+            "document": document,
+            "design": design,
+            "code": code,
+        }
+        entry_file = self.cache_dir / f"{key}.json"
+        entry_file.write_text(json.dumps(entry, indent=2, ensure_ascii=False), encoding="utf-8")
+
+        self._exact[key] = entry
+        self._documents.append(document)
+        self._entries.append(entry)
+        self._matrix = None
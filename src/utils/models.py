@@ -1,11 +1,15 @@
 from enum import Enum
 
-class StrEnum(str, Enum):
-    def __str__(self):
-        return self.value
-    
-    def __repr__(self):
-        return self.value
+try:
+    # Python 3.11+: C-implemented StrEnum, same semantics without a
+    # Python-level __str__ override on every format/lookup.
+    from enum import StrEnum
+except ImportError: # environment pins 3.10
+    class StrEnum(str, Enum):
+        __slots__ = ()
+
+        def __str__(self):
+            return self.value
 
 class MODELS(StrEnum):
     GPT4o="gpt-4o-2024-08-06"